@@ -5,21 +5,15 @@ import pandas as pd
 # List of sports for which badges will be generated
 target_sports = ["baseball", "football", "basketball", "hockey"]
 
-# Load the dataset from the Parquet file
+# Load the dataset from the Parquet file (only the columns needed for counting)
 parquet_path = os.path.join("output", "dataset.parquet")
-df = pd.read_parquet(parquet_path)
+df = pd.read_parquet(parquet_path, columns=["category", "parallel"])
 
-# Initialize counts dictionary
-counts = {}
-
-# Compute counts: only count records where 'parallel' is empty or null
-for sport in target_sports:
-    # Ensure case-insensitive matching for the category
-    sport_mask = df["category"].str.lower() == sport.lower()
-    # Condition for no parallel: either null or empty string
-    no_parallel_mask = df["parallel"].isnull() | (df["parallel"] == "")
-    count = df[sport_mask & no_parallel_mask].shape[0]
-    counts[sport] = count
+# Compute counts in a single pass: only count records where 'parallel' is empty or null
+no_parallel_mask = df["parallel"].isnull() | (df["parallel"] == "")
+# Ensure case-insensitive matching for the category
+category_counts = df.loc[no_parallel_mask, "category"].str.lower().value_counts()
+counts = {sport: int(category_counts.get(sport, 0)) for sport in target_sports}
 
 # Debug: Output the counts to the console
 print("Card counts by sport:")
@@ -1,171 +1,328 @@
+from concurrent.futures import ProcessPoolExecutor
 import json
+import os
 from pathlib import Path
-import pandas as pd
+import shutil
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import sys
 
-def flatten_card_data(category, year, release, json_data):
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Column layout of the Parquet dataset. The "_is_variation" column is only used
+# internally for duplicate checking and is dropped before writing.
+RECORD_SCHEMA = pa.schema([
+    ("category", pa.string()),
+    ("release_unique_id", pa.string()),
+    ("year", pa.string()),
+    ("release", pa.string()),
+    ("release_name", pa.string()),
+    ("set_unique_id", pa.string()),
+    ("set", pa.string()),
+    ("card_unique_id", pa.string()),
+    ("card_number", pa.string()),
+    ("card_name", pa.string()),
+    ("attributes", pa.list_(pa.string())),
+    ("note", pa.string()),
+    ("parallel", pa.string()),
+    ("numberedTo", pa.int64()),
+    ("insertOdds", pa.list_(pa.struct([("product", pa.string()), ("odds", pa.string())]))),
+    ("_is_variation", pa.bool_()),
+])
+OUTPUT_SCHEMA = RECORD_SCHEMA.remove(RECORD_SCHEMA.get_field_index("_is_variation"))
+
+# Low-cardinality string columns that are dictionary encoded in the Parquet file.
+DICTIONARY_COLUMNS = ["category", "year", "release", "release_name", "set", "parallel"]
+ROW_GROUP_SIZE = 128 * 1024
+
+def load_json(json_file):
+    """Load a JSON file, using orjson for faster parsing when it is installed."""
+    if orjson is not None:
+        return orjson.loads(json_file.read_bytes())
+    with json_file.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+def append_record(cols, card_fields, card_name, attributes, note, parallel, numbered_to, insert_odds, is_variation):
+    """
+    Append one flat record to `cols`, looking each column up by name.
+    `card_fields` maps the columns shared by every record of a card (category
+    through card_number) to their values.
+    """
+    for name, value in card_fields.items():
+        cols[name].append(value)
+    cols["card_name"].append(card_name)
+    cols["attributes"].append(attributes)
+    cols["note"].append(note)
+    cols["parallel"].append(parallel)
+    cols["numberedTo"].append(numbered_to)
+    cols["insertOdds"].append(insert_odds)
+    cols["_is_variation"].append(is_variation)
+
+def flatten_card_data(category, year, release, json_data, cols):
     """
     Iterate over each set and each card to create flat records.
-    For every card, a base record is always created using the updated base_record.
+    For every card, a base record is always created.
     Then, additional records for parallels and variations are created.
     
+    Records are appended column by column to `cols`, a dict mapping every column
+    name in RECORD_SCHEMA to a list, so no per-record dict is built.
+    
     Variation records have a modified card_name (appending the variation name in parenthesis)
     and a combined attributes list (base attributes plus any variation attributes, then "VAR").
     
     For parallel records, if the parallel object defines a "numberedTo" value or an "insertOdds" array,
     they are applied to the record.
     
-    A temporary field '_is_variation' is used internally for duplicate checking,
+    A temporary column '_is_variation' is used internally for duplicate checking,
     but will be removed before writing the final output.
     """
-    records = []
-    source = json_data.get("name", "")
+    # Values repeated on every record of the file/set are interned so the
+    # columns hold references to a single string object.
+    category = sys.intern(category)
+    year = sys.intern(year)
+    release = sys.intern(release)
+    source = sys.intern(json_data.get("name", ""))
+    release_unique_id = sys.intern(json_data.get("uniqueId", ""))
 
     for card_set in json_data.get("sets", []):
-        set_name = card_set.get("name", "")
+        set_unique_id = sys.intern(card_set.get("uniqueId", ""))
+        set_name = sys.intern(card_set.get("name", ""))
         # Get set-level parallels that apply to all cards/variations.
         set_parallels = card_set.get("parallels", [])
         for card in card_set.get("cards", []):
-            base_card_name = card.get("name", "")
-            # Updated base record with GUID fields.
-            base_record = {
+            # Columns shared by the base, parallel and variation records of this card.
+            card_fields = {
                 "category": category,
-                "release_unique_id": json_data.get("uniqueId", ""),
+                "release_unique_id": release_unique_id,
                 "year": year,
                 "release": release,
                 "release_name": source,
-                "set_unique_id": card_set.get("uniqueId", ""),
+                "set_unique_id": set_unique_id,
                 "set": set_name,
                 "card_unique_id": card.get("uniqueId", ""),
                 "card_number": card.get("number", ""),
-                "card_name": base_card_name,
-                "attributes": card.get("attributes", []),
-                "note": card.get("note", ""),
-                "parallel": "",
-                "_is_variation": False
             }
-            records.append(base_record)
+            base_card_name = card.get("name", "")
+            base_attributes = card.get("attributes", [])
+            base_note = card.get("note", "")
+
+            # Base record.
+            append_record(cols, card_fields, base_card_name, base_attributes, base_note, "", None, None, False)
 
             # Add parallels for the base card: combine card-level and set-level parallels.
+            # Apply the parallel's numberedTo and insertOdds if provided.
             base_parallels = card.get("parallels", [])
-            all_base_parallels = base_parallels + set_parallels
-            for parallel in all_base_parallels:
-                parallel_record = base_record.copy()
-                parallel_record["parallel"] = parallel.get("name", "")
-                # Apply parallel's numberedTo if provided.
-                if "numberedTo" in parallel:
-                    parallel_record["numberedTo"] = parallel["numberedTo"]
-                # Apply parallel's insertOdds if provided.
-                if "insertOdds" in parallel:
-                    parallel_record["insertOdds"] = parallel["insertOdds"]
-                parallel_record["_is_variation"] = False
-                records.append(parallel_record)
+            for parallel in base_parallels + set_parallels:
+                append_record(
+                    cols, card_fields, base_card_name, base_attributes, base_note, parallel.get("name", ""),
+                    parallel.get("numberedTo"), parallel.get("insertOdds"), False,
+                )
             
             # Process variations for the card.
             for variation in card.get("variations", []):
                 variation_name = variation.get("variation", "")
-                variation_record = base_record.copy()
                 # Update card_name: append the variation name in parenthesis.
                 if variation_name:
-                    variation_record["card_name"] = f"{base_card_name} ({variation_name})"
+                    variation_card_name = f"{base_card_name} ({variation_name})"
                 else:
-                    variation_record["card_name"] = base_card_name
+                    variation_card_name = base_card_name
 
                 # Combine attributes: base attributes plus any variation attributes, then append "VAR".
-                combined_attributes = base_record["attributes"].copy() if base_record["attributes"] else []
+                combined_attributes = base_attributes.copy() if base_attributes else []
                 if variation.get("attributes"):
                     combined_attributes.extend(variation.get("attributes"))
                 combined_attributes.append("VAR")
-                variation_record["attributes"] = combined_attributes
 
                 # Override note if the variation has its own.
-                if variation.get("note"):
-                    variation_record["note"] = variation.get("note")
+                variation_note = variation.get("note") or base_note
                 # Carry over additional properties if present.
-                if "insertOdds" in variation:
-                    variation_record["insertOdds"] = variation.get("insertOdds")
-                if "numberedTo" in variation:
-                    variation_record["numberedTo"] = variation.get("numberedTo")
-                # Mark as a variation.
-                variation_record["_is_variation"] = True
-                variation_record["parallel"] = ""
-                records.append(variation_record)
+                variation_numbered_to = variation.get("numberedTo")
+                variation_insert_odds = variation.get("insertOdds")
+                append_record(
+                    cols, card_fields, variation_card_name, combined_attributes, variation_note, "",
+                    variation_numbered_to, variation_insert_odds, True,
+                )
                 
                 # Add parallels for the variation: combine variation-level and set-level parallels.
+                # A parallel's numberedTo and insertOdds override the variation's when provided.
                 variation_parallels = variation.get("parallels", [])
-                all_variation_parallels = variation_parallels + set_parallels
-                for v_parallel in all_variation_parallels:
-                    v_par_record = variation_record.copy()
-                    v_par_record["parallel"] = v_parallel.get("name", "")
-                    # Apply parallel's numberedTo if provided.
-                    if "numberedTo" in v_parallel:
-                        v_par_record["numberedTo"] = v_parallel["numberedTo"]
-                    # Apply parallel's insertOdds if provided.
-                    if "insertOdds" in v_parallel:
-                        v_par_record["insertOdds"] = v_parallel["insertOdds"]
-                    v_par_record["_is_variation"] = True
-                    records.append(v_par_record)
-    return records
+                for v_parallel in variation_parallels + set_parallels:
+                    append_record(
+                        cols, card_fields, variation_card_name, combined_attributes, variation_note, v_parallel.get("name", ""),
+                        v_parallel.get("numberedTo", variation_numbered_to),
+                        v_parallel.get("insertOdds", variation_insert_odds),
+                        True,
+                    )
+
+def collect_unique_ids(table, set_names, card_names, dup_set_ids, dup_card_ids):
+    """
+    Record the set/card names seen for each set_unique_id and card_unique_id in the
+    base records of a table (those with no parallel and not marked as a variation).
+    Any id that maps to more than one name is added to the matching duplicate set.
+    """
+    is_base = pc.and_(pc.equal(table["parallel"], ""), pc.invert(table["_is_variation"]))
+    base_table = table.filter(is_base)
+
+    for set_id, set_name in zip(base_table["set_unique_id"].to_pylist(), base_table["set"].to_pylist()):
+        if set_names.setdefault(set_id, set_name) != set_name:
+            dup_set_ids.add(set_id)
+
+    for card_id, card_name in zip(base_table["card_unique_id"].to_pylist(), base_table["card_name"].to_pylist()):
+        if card_names.setdefault(card_id, card_name) != card_name:
+            dup_card_ids.add(card_id)
+
+def flatten_file(args):
+    """
+    Load and flatten a single JSON file into an Arrow table.
+    This runs in a worker process, so it takes a single picklable tuple of
+    (category, year, release, json_file).
+    """
+    category, year, release, json_file = args
+    try:
+        data = load_json(json_file)
+        cols = {name: [] for name in RECORD_SCHEMA.names}
+        flatten_card_data(category, year, release, data, cols)
+        return pa.table(cols, schema=RECORD_SCHEMA)
+    except Exception as e:
+        raise RuntimeError(f"Error processing {json_file}: {e}") from None
+
+def write_parquet(json_files, parquet_path):
+    """
+    Flatten the JSON files in parallel worker processes and stream the resulting
+    Arrow tables into a single Parquet file, in the order the files were given,
+    so the full dataset is never held in memory at once.
+    
+    Per-file tables are buffered and concatenated (without copying) into full row
+    groups, rather than writing a small row group for every file. A row group never
+    spans two categories.
+    Returns the number of records written.
+    """
+    set_names = {}
+    card_names = {}
+    dup_set_ids = set()
+    dup_card_ids = set()
+    total_records = 0
+    pending = []
+    pending_rows = 0
+    pending_category = None
+
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor, \
+            pq.ParquetWriter(
+                parquet_path,
+                OUTPUT_SCHEMA,
+                compression="zstd",
+                compression_level=3,
+                use_dictionary=DICTIONARY_COLUMNS,
+            ) as writer:
+        try:
+            for table in executor.map(flatten_file, json_files, chunksize=8):
+                if not table.num_rows:
+                    continue
+                collect_unique_ids(table, set_names, card_names, dup_set_ids, dup_card_ids)
+                total_records += table.num_rows
+
+                # Start a new row group when the category changes.
+                category = table["category"][0].as_py()
+                if pending and category != pending_category:
+                    writer.write_table(pa.concat_tables(pending), row_group_size=ROW_GROUP_SIZE)
+                    pending, pending_rows = [], 0
+                pending_category = category
+
+                # Remove the temporary field '_is_variation' before writing.
+                pending.append(table.drop(["_is_variation"]))
+                pending_rows += table.num_rows
+
+                # Write out full row groups, keeping the remainder buffered.
+                while pending_rows >= ROW_GROUP_SIZE:
+                    combined = pa.concat_tables(pending)
+                    writer.write_table(combined.slice(0, ROW_GROUP_SIZE), row_group_size=ROW_GROUP_SIZE)
+                    pending = [combined.slice(ROW_GROUP_SIZE)]
+                    pending_rows -= ROW_GROUP_SIZE
+        except RuntimeError as e:
+            print(e)
+            # Don't wait for the remaining queued files before exiting.
+            executor.shutdown(wait=False, cancel_futures=True)
+            sys.exit(1)
+
+        if pending:
+            writer.write_table(pa.concat_tables(pending), row_group_size=ROW_GROUP_SIZE)
+
+    if dup_set_ids:
+        raise ValueError(f"Duplicate set_unique_id found for multiple sets: {sorted(dup_set_ids)}")
+    if dup_card_ids:
+        raise ValueError(f"Duplicate card_unique_id found in base records: {sorted(dup_card_ids)}")
+    return total_records
+
+def write_partitioned_dataset(parquet_path, dataset_dir):
+    """
+    Rewrite the Parquet file as a hive-partitioned dataset with one directory per
+    category (category=baseball/, ...), so readers filtering by sport only scan
+    that sport's files. The file is read back in batches rather than all at once.
+    Any previous dataset_dir is removed first, so partitions for categories that no
+    longer exist don't linger.
+    """
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    ds.write_dataset(
+        ds.dataset(parquet_path, format="parquet"),
+        dataset_dir,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("category", pa.string())]), flavor="hive"),
+        file_options=ds.ParquetFileFormat().make_write_options(
+            compression="zstd",
+            compression_level=3,
+            use_dictionary=DICTIONARY_COLUMNS,
+        ),
+        min_rows_per_group=ROW_GROUP_SIZE,
+        max_rows_per_group=ROW_GROUP_SIZE,
+        preserve_order=True,
+    )
 
 def main():
     # Since this script is in the 'scripts' folder, the repository root is one level up.
     base_dir = Path(__file__).parent.parent
     categories_dir = base_dir / "categories"
-    all_records = []
-
-    # Process JSON files and flatten records.
-    for category_dir in categories_dir.iterdir():
-        if category_dir.is_dir():
-            for year_dir in category_dir.iterdir():
-                if year_dir.is_dir():
-                    for json_file in year_dir.glob("*.json"):
-                        parts = json_file.stem.split("-", 1)
-                        release = parts[1] if len(parts) == 2 else parts[0]
-                        try:
-                            with json_file.open("r", encoding="utf-8") as f:
-                                data = json.load(f)
-                            records = flatten_card_data(category_dir.name, year_dir.name, release, data)
-                            all_records.extend(records)
-                        except Exception as e:
-                            print(f"Error processing {json_file}: {e}")
-                            sys.exit(1)
-
-    if not all_records:
-        print("No records found to process.")
-        sys.exit(1)
-
-    # Create a DataFrame.
-    df = pd.DataFrame(all_records)
-
-    # Filter to base records: those with no parallel and not marked as a variation.
-    df_base = df[(df["parallel"] == "") & (~df["_is_variation"])]
-
-    # For set_unique_id, drop duplicate rows (since the same set appears on multiple cards)
-    # then group by set_unique_id and check if a single set name is associated with each.
-    df_sets = df_base[['set_unique_id', 'set']].drop_duplicates()
-    dup_sets = df_sets.groupby('set_unique_id')['set'].nunique()
-    if (dup_sets > 1).any():
-        dup_ids = dup_sets[dup_sets > 1].index.tolist()
-        raise ValueError(f"Duplicate set_unique_id found for multiple sets: {dup_ids}")
-
-    # For card_unique_id, drop duplicate rows (if any) and then check for duplicates.
-    df_cards = df_base[['card_unique_id', 'card_name']].drop_duplicates()
-    if df_cards['card_unique_id'].duplicated().any():
-        dup_ids = df_cards[df_cards['card_unique_id'].duplicated(keep=False)]['card_unique_id'].unique()
-        raise ValueError(f"Duplicate card_unique_id found in base records: {dup_ids}")
-
-    # Remove the temporary field '_is_variation' from all records.
-    df = df.drop(columns=["_is_variation"])
-
-    # Sort the DataFrame by year and release (ascending).
-    df = df.sort_values(by=["year", "release"], ascending=True)
+    json_files = []
+
+    # Collect the JSON files to process in a single walk of <category>/<year>/*.json.
+    for json_file in categories_dir.rglob("*.json"):
+        rel_parts = json_file.relative_to(categories_dir).parts
+        if len(rel_parts) != 3:
+            # Skip category definitions (e.g. baseball.json) and anything nested deeper.
+            continue
+        category, year = rel_parts[0], rel_parts[1]
+        parts = json_file.stem.split("-", 1)
+        release = parts[1] if len(parts) == 2 else parts[0]
+        json_files.append((category, year, release, json_file))
+
+    # Process the files by category, year and release (ascending) so the dataset is written
+    # sorted, keeping each category in contiguous row groups for filtered reads.
+    json_files.sort(key=lambda item: (item[0], item[1], item[2]))
 
     # Write to a Parquet file.
     output_dir = base_dir / "output"
     output_dir.mkdir(exist_ok=True)
     parquet_path = output_dir / "dataset.parquet"
-    df.to_parquet(parquet_path, index=False)
-    print(f"Dataset written to {parquet_path}")
+    dataset_dir = output_dir / "dataset"
+    try:
+        total_records = write_parquet(json_files, parquet_path)
+        if not total_records:
+            print("No records found to process.")
+            sys.exit(1)
+        print(f"Dataset written to {parquet_path}")
+
+        # Write the same records partitioned by category.
+        write_partitioned_dataset(parquet_path, dataset_dir)
+        print(f"Partitioned dataset written to {dataset_dir}")
+    except BaseException:
+        # Don't leave a partially written or stale dataset behind.
+        parquet_path.unlink(missing_ok=True)
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        raise
 
 if __name__ == "__main__":
     main()
@@ -1,54 +1,82 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pacsv
 import json
+import os
 import sys
 import uuid
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Checklist CSV columns used by this script; all of them are read as strings.
+CSV_COLUMNS = ("YEAR", "BRAND", "PROGRAM", "SPORT", "CARD SET", "CARD NUMBER", "ATHLETE", "SEQUENCE")
+
+# pandas.read_csv's default missing-value tokens, so cells such as "N/A" or "None"
+# are read as empty strings exactly as they were with pd.read_csv(...).fillna("").
+CSV_NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+    "n/a", "nan", "null",
+]
+
 def generate_uuid():
     return str(uuid.uuid4())
 
+def uuid_batch(n):
+    """Return a list of n random (version 4) UUID strings, drawing the random bytes in a single call."""
+    buf = os.urandom(16 * n)
+    return [str(uuid.UUID(bytes=buf[i * 16:(i + 1) * 16], version=4)) for i in range(n)]
+
 def normalize_text(s):
     """Trim leading/trailing whitespace from a string."""
     return s.strip() if isinstance(s, str) else ""
 
-def normalize_card_number(num_str):
-    """Trim and, if numeric, convert to a canonical integer string."""
-    num_str = normalize_text(num_str)
-    if num_str.isdigit():
-        return str(int(num_str))
-    return num_str
+# (keyword, attribute code) rules applied to lowercased set names.
+ATTRIBUTE_RULES = (
+    ("autograph", "AU"),
+    ("relic", "RELIC"),
+)
 
-def get_attributes_for_set(set_name):
+def get_attributes_for_set(lower_set):
     """
-    Return a list of attribute codes to apply to cards based on the set name.
+    Return a list of attribute codes to apply to cards based on the lowercased set name.
     
-    Rules:
-      - If the set name contains "autograph" (case-insensitive), add "AU"
-      - If the set name contains "relic" (case-insensitive), add "RELIC"
+    Rules (see ATTRIBUTE_RULES):
+      - If the set name contains "autograph", add "AU"
+      - If the set name contains "relic", add "RELIC"
     """
-    attrs = []
-    lower_set = set_name.lower()
-    if "autograph" in lower_set:
-        attrs.append("AU")
-    if "relic" in lower_set:
-        attrs.append("RELIC")
-    return attrs
+    return [code for keyword, code in ATTRIBUTE_RULES if keyword in lower_set]
 
-def is_parallel_candidate(group1, group2):
+def get_base_key(group):
     """
-    Returns True if group2 should be considered a parallel of group1.
-    Currently, if the normalized set of (card number, athlete) pairs in the base rows
-    of both groups are equal, then group2 is a parallel candidate.
+    Return a hashable key identifying the base rows of a group.
+    Two groups with the same set of (card number, athlete) pairs in their base rows
+    share a key, and the later one is considered a parallel of the earlier one.
     """
-    def get_base_keys(group):
-        return {
-            (normalize_card_number(row["CARD NUMBER"]), normalize_text(row["ATHLETE"]))
-            for row in group["base_rows"]
-        }
-    return get_base_keys(group1) == get_base_keys(group2)
+    return frozenset((row[0], row[1]) for row in group["base_rows"])
 
 def process_csv_with_pandas(file_path):
-    # Load CSV into a pandas DataFrame. Fill missing values with an empty string.
-    df = pd.read_csv(file_path, dtype=str).fillna("")
+    # Load CSV with pyarrow's multi-threaded reader, keeping only the columns we use,
+    # then convert to a pandas DataFrame. Fill missing values with an empty string.
+    try:
+        table = pacsv.read_csv(
+            file_path,
+            convert_options=pacsv.ConvertOptions(
+                column_types={c: pa.string() for c in CSV_COLUMNS},
+                include_columns=list(CSV_COLUMNS),
+                null_values=CSV_NULL_VALUES,
+                strings_can_be_null=True,
+            ),
+        )
+        df = table.to_pandas().fillna("")
+    except pa.ArrowInvalid:
+        # pyarrow rejects rows with missing trailing fields (e.g. an empty SEQUENCE left
+        # off by a spreadsheet export); pandas pads them with empty values instead.
+        df = pd.read_csv(file_path, dtype=str, usecols=list(CSV_COLUMNS)).fillna("")
     
     # Top-level metadata (assumed consistent across the CSV)
     top_year    = normalize_text(df.loc[0, "YEAR"])
@@ -56,17 +84,41 @@ def process_csv_with_pandas(file_path):
     top_program = normalize_text(df.loc[0, "PROGRAM"])
     top_sport   = normalize_text(df.loc[0, "SPORT"])
     
+    # Normalize the columns used for grouping in one vectorized pass, then pull
+    # them out as plain object arrays so the loop below works on Python values
+    # instead of building a Series per row.
+    #  - CARD SET / ATHLETE are trimmed.
+    #  - CARD NUMBER is trimmed and, if numeric, converted to a canonical integer string.
+    #  - SEQUENCE is converted to an int when numeric, otherwise None.
+    card_set_col = df["CARD SET"].str.strip()
+    card_number_col = df["CARD NUMBER"].str.strip()
+    numeric_mask = card_number_col.str.fullmatch(r"\d+")
+    # Strip leading zeros as strings (no fixed-width int cast, so long numbers don't overflow).
+    canonical_numbers = card_number_col.loc[numeric_mask].str.lstrip("0")
+    card_number_col.loc[numeric_mask] = canonical_numbers.mask(canonical_numbers == "", "0")
+    athlete_col = df["ATHLETE"].str.strip()
+    sequence_col = df["SEQUENCE"].str.strip()
+    sequence_mask = sequence_col.str.fullmatch(r"\d+")
+    
+    card_sets    = card_set_col.to_numpy()
+    card_numbers = card_number_col.to_numpy()
+    athletes     = athlete_col.to_numpy()
+    # Python ints (not an int64-backed dtype), so long sequences don't overflow.
+    sequences    = np.full(len(sequence_col), None, dtype=object)
+    sequences[sequence_mask.to_numpy()] = [int(s) for s in sequence_col[sequence_mask]]
+    
     # Initial grouping using the "starts-with" rule.
     # Each group is a dict with:
     #  - "base_set": the base set name (first occurrence, trimmed)
-    #  - "base_rows": list of rows (as Series) whose CARD SET exactly equals the base set
+    #  - "base_rows": list of rows (as (card number, athlete, sequence) tuples) whose CARD SET exactly equals the base set
     #  - "parallel_rows": list of tuples (row, parallel_name) for rows where CARD SET starts with base_set + " "
     groups = []
     current_group = None
     current_base = None
     
-    for _, row in df.iterrows():
-        card_set = normalize_text(row["CARD SET"])
+    for i in range(len(card_sets)):
+        card_set = card_sets[i]
+        row = (card_numbers[i], athletes[i], sequences[i])
         if current_group is None:
             current_group = {
                 "base_set": card_set,
@@ -95,20 +147,22 @@ def process_csv_with_pandas(file_path):
     
     # --- Updated Merging Step ---
     # Instead of merging only with the immediately following group,
-    # look back on all previously merged groups.
+    # look back on all previously merged groups (indexed by their base key).
     merged_groups = []
+    merged_by_key = {}
     for group in groups:
-        merged = False
-        for m_group in merged_groups:
-            if is_parallel_candidate(m_group, group):
-                # Merge the current group into the previously merged group.
-                for row in group["base_rows"]:
-                    m_group["parallel_rows"].append((row, normalize_text(group["base_set"])))
-                for tup in group["parallel_rows"]:
-                    m_group["parallel_rows"].append(tup)
-                merged = True
-                break
-        if not merged:
+        key = get_base_key(group)
+        m_group = merged_by_key.get(key)
+        if m_group is not None:
+            # Merge the current group into the previously merged group.
+            for row in group["base_rows"]:
+                m_group["parallel_rows"].append((row, normalize_text(group["base_set"])))
+            for tup in group["parallel_rows"]:
+                m_group["parallel_rows"].append(tup)
+        else:
+            # Get attributes from the set name once per merged group.
+            group["set_attributes"] = get_attributes_for_set(group["base_set"].lower())
+            merged_by_key[key] = group
             merged_groups.append(group)
     
     # Process each merged group into a set object.
@@ -117,51 +171,41 @@ def process_csv_with_pandas(file_path):
         base_set = group["base_set"]
         base_rows = group["base_rows"]
         parallel_rows = group["parallel_rows"]
+        set_attributes = group["set_attributes"]
         
-        # Get attributes from the set name.
-        set_attributes = get_attributes_for_set(base_set)
+        # One uniqueId for each base card plus one for the set itself.
+        uuids = uuid_batch(len(base_rows) + 1)
         
         # Process base rows into card objects.
         base_cards = []
-        base_card_numbers = set()
-        base_sequences = set()
+        # Sequence of each base card, in the same order as base_cards.
+        base_sequences = []
+        # Index of base cards by card number (first card wins for duplicate numbers).
+        cards_by_number = {}
         for row in base_rows:
-            card_number = normalize_card_number(row["CARD NUMBER"])
-            athlete = normalize_text(row["ATHLETE"])
-            seq_str = normalize_text(row["SEQUENCE"])
-            seq_value = int(seq_str) if seq_str.isdigit() else None
+            card_number, athlete, seq_value = row
             
-            base_card_numbers.add(card_number)
-            if seq_value is not None:
-                base_sequences.add(seq_value)
-                
             card_obj = {
-                "uniqueId": generate_uuid(),
+                "uniqueId": uuids.pop(),
                 "number": card_number,
                 "name": athlete,
             }
-            card_obj["_sequence"] = seq_value  # temporary field
-            card_obj["parallels"] = []
             if set_attributes:
                 card_obj["attributes"] = set_attributes.copy()
             base_cards.append(card_obj)
+            base_sequences.append(seq_value)
+            cards_by_number.setdefault(card_number, card_obj)
         
         # Determine if the base cards share a uniform (non-None) sequence.
-        uniform_base_seq = False
-        if base_sequences and len(base_sequences) == 1 and (None not in base_sequences):
-            set_numberedTo = base_sequences.pop()
-            uniform_base_seq = True
-        
-        # Clean up base card objects.
-        for card_obj in base_cards:
-            if uniform_base_seq:
-                card_obj.pop("_sequence", None)
-            else:
-                if card_obj.get("_sequence") is not None:
-                    card_obj["numberedTo"] = card_obj["_sequence"]
-                card_obj.pop("_sequence", None)
-            if "parallels" in card_obj and not card_obj["parallels"]:
-                del card_obj["parallels"]
+        unique_sequences = {seq for seq in base_sequences if seq is not None}
+        uniform_base_seq = len(unique_sequences) == 1
+        if uniform_base_seq:
+            set_numberedTo = unique_sequences.pop()
+        else:
+            # Otherwise each base card carries its own sequence.
+            for card_obj, seq_value in zip(base_cards, base_sequences):
+                if seq_value is not None:
+                    card_obj["numberedTo"] = seq_value
         
         # Process parallel rows.
         # Group parallel rows by parallel name.
@@ -176,15 +220,13 @@ def process_csv_with_pandas(file_path):
             parallel_card_numbers = set()
             parallel_sequences = set()
             for row in rows_list:
-                card_number = normalize_card_number(row["CARD NUMBER"])
+                card_number, _, seq_value = row
                 parallel_card_numbers.add(card_number)
-                seq_str = normalize_text(row["SEQUENCE"])
-                seq_value = int(seq_str) if seq_str.isdigit() else None
                 if seq_value is not None:
                     parallel_sequences.add(seq_value)
             
             # If the parallel covers all base cards, attach at the set level.
-            if parallel_card_numbers == base_card_numbers:
+            if parallel_card_numbers == cards_by_number.keys():
                 parallel_obj = {"name": parallel_name}
                 if parallel_sequences and len(parallel_sequences) == 1 and (None not in parallel_sequences):
                     parallel_obj["numberedTo"] = parallel_sequences.pop()
@@ -192,23 +234,16 @@ def process_csv_with_pandas(file_path):
             else:
                 # Otherwise, attach each parallel row to its corresponding base card.
                 for row in rows_list:
-                    card_number = normalize_card_number(row["CARD NUMBER"])
-                    seq_str = normalize_text(row["SEQUENCE"])
-                    seq_value = int(seq_str) if seq_str.isdigit() else None
+                    card_number, athlete, seq_value = row
                     parallel_obj = {"name": parallel_name}
                     if seq_value is not None:
                         parallel_obj["numberedTo"] = seq_value
-                    found = False
-                    for card_obj in base_cards:
-                        if card_obj["number"] == card_number:
-                            if "parallels" not in card_obj:
-                                card_obj["parallels"] = []
-                            card_obj["parallels"].append(parallel_obj)
-                            found = True
-                            break
-                    if not found:
+                    card_obj = cards_by_number.get(card_number)
+                    if card_obj is not None:
+                        # Parallels lists are only created once a card has one.
+                        card_obj.setdefault("parallels", []).append(parallel_obj)
+                    else:
                         # Create a new card record for this card number with a note.
-                        athlete = normalize_text(row["ATHLETE"])
                         new_card = {
                             "uniqueId": generate_uuid(),
                             "number": card_number,
@@ -221,27 +256,21 @@ def process_csv_with_pandas(file_path):
                         if set_attributes:
                             new_card["attributes"] = set_attributes.copy()
                         base_cards.append(new_card)
-                        base_card_numbers.add(card_number)
+                        cards_by_number[card_number] = new_card
         
         # --- Duplicate Removal Step ---
-        # Remove duplicate cards (having the same number and name) from the set.
-        unique_cards = []
-        seen_keys = set()
-        duplicates_found = False
+        # Remove duplicate cards (having the same number and name) from the set,
+        # keeping the first occurrence of each.
+        unique_by_key = {}
         for card in base_cards:
-            key = (card["number"], card["name"])
-            if key in seen_keys:
-                duplicates_found = True
-                continue
-            seen_keys.add(key)
-            unique_cards.append(card)
-        if duplicates_found:
+            unique_by_key.setdefault((card["number"], card["name"]), card)
+        if len(unique_by_key) != len(base_cards):
             print(f"Warning: Duplicate records found in set '{base_set}'. Please manually verify the accuracy.")
-        base_cards = unique_cards
+        base_cards = list(unique_by_key.values())
         
         # Build the set object.
         set_obj = {
-            "uniqueId": generate_uuid(),
+            "uniqueId": uuids.pop(),
             "name": base_set,
             "cards": base_cards,
             "parallels": set_level_parallels,
@@ -272,6 +301,17 @@ if __name__ == "__main__":
     output_json = sys.argv[2]
     
     result = process_csv_with_pandas(input_csv)
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(result, f, indent=2)
+    # Both paths write the same bytes: 2-space indent, non-ASCII characters as UTF-8.
+    output = None
+    if orjson is not None:
+        try:
+            # orjson pretty-prints in C (2-space indent only).
+            output = orjson.dumps(result, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            # orjson can't serialize integers beyond 64 bits; use json for those.
+            output = None
+    if output is None:
+        output = json.dumps(result, indent=2, ensure_ascii=False).encode("utf-8")
+    with open(output_json, "wb") as f:
+        f.write(output)
     print(f"JSON output written to {output_json}")